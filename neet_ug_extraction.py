@@ -1,30 +1,78 @@
 import streamlit as st
 import pandas as pd
 import re
+import html
 import logging
-import sys
 import os
-import tempfile
+import sys
+import threading
+from collections import deque
 from datetime import datetime
-from io import StringIO
-
-# Set up logging to capture output in memory
-log_stream = StringIO()
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(log_stream),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-logger = logging.getLogger()
+from io import BytesIO
+
+# Logging handler that keeps the most recent formatted records in memory
+class RingBufferHandler(logging.Handler):
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+LOG_HANDLER_NAME = 'neet_ug_extraction'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Application logger; its level is fixed at DEBUG and each handler decides what it keeps,
+# so no request has to change logging state
+logger = logging.getLogger('neet_ug_extraction')
+
+# Set up process-wide log handlers. Logs shown in the UI are collected per call in
+# process_file. Cached as a resource so Streamlit reruns don't reinstall handlers.
+@st.cache_resource
+def setup_logging():
+    log_handlers = []
+    # Mirror logs to stdout only when explicitly requested
+    if os.environ.get('NEET_DEBUG_STDOUT') == '1':
+        log_handlers.append(logging.StreamHandler(sys.stdout))
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    # Drop handlers from an earlier setup (e.g. after Streamlit's "Clear cache")
+    for handler in logger.handlers[:]:
+        if handler.get_name() == LOG_HANDLER_NAME:
+            logger.removeHandler(handler)
+            handler.close()
+    for handler in log_handlers:
+        handler.set_name(LOG_HANDLER_NAME)
+        handler.setLevel(logging.INFO)
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+
+setup_logging()
 
 # Valid categories for validation
-VALID_CATEGORIES = {'OBC', 'SC', 'ST', 'SEBC', 'NTC', 'NTD', 'NTB', 'SBC', 'EWS', 'HA', 'VJA', 'SOBC', 'D1', 'D2', 'D3', 'PWD', 'ORP-C', 'SEBCHA', 'SEBCD1', 'SEBCD2', 'D1HA' ,'MKB'}
+VALID_CATEGORIES = frozenset({'OBC', 'SC', 'ST', 'SEBC', 'NTC', 'NTD', 'NTB', 'SBC', 'EWS', 'HA', 'VJA', 'SOBC', 'D1', 'D2', 'D3', 'PWD', 'ORP-C', 'SEBCHA', 'SEBCD1', 'SEBCD2', 'D1HA' ,'MKB'})
+
+# Disability/sub-categories that may follow a main category
+_DIS_CATS = frozenset({'D1', 'D2', 'D3', 'PWD', 'ORP-C', 'HA', 'D1HA'})
+
+# Precompiled patterns used inside the parse loop. All are anchored or token-bounded and
+# free of nested quantifiers, so backtracking stays linear; stdlib re is kept over
+# google-re2, whose per-call overhead is far higher on the short strings matched here.
+_RE_HEADER = re.compile(r'\s*Sr\.\s+AIR\s+NEET')
+# Standalone M/F token that ends the name column
+_RE_GENDER = re.compile(r'(?<!\S)[MF](?!\S)')
+# First token starting with a "NNN:" college code
+_RE_COLLEGE = re.compile(r'(?<!\S)(\d+):')
+
+# Header/footer prefixes skipped outside the table
+_SKIP_PREFIXES = ('GOVERNMENT', 'Note:', 'Admissions', 'SELECTION', 'Printed', 'I.Q.:')
 
 # Function to parse the text file
-def parse_text_file(text):
+def parse_text_file(text, verbose=False):
     logger.info("Starting to parse text file")
     lines = text.split('\n')
     data = []
@@ -34,17 +82,27 @@ def parse_text_file(text):
     row_count = 0
     skipped_lines = 0
 
+    # Local aliases keep global lookups out of the per-token loop
+    valid_categories = VALID_CATEGORIES
+    dis_cats = _DIS_CATS
+    gender_search = _RE_GENDER.search
+    college_search = _RE_COLLEGE.search
+    # Per-line debug calls are only made for verbose runs
+    debug_enabled = verbose
+
     for i, line in enumerate(lines):
         line = line.strip()
         if not line:
-            logger.debug(f"Line {i+1}: Skipped - empty line")
+            if debug_enabled:
+                logger.debug("Line %d: Skipped - empty line", i + 1)
             skipped_lines += 1
             continue
 
-        logger.debug(f"Line {i+1}: {line}")
+        if debug_enabled:
+            logger.debug("Line %d: %s", i + 1, line)
 
-        # Detect table start
-        if re.match(r'^\s*Sr\.\s+AIR\s+NEET', line) or 'Sr.     AIR     NEET' in line:
+        # Detect table start (cheap substring check before the regex)
+        if 'Sr.' in line and 'NEET' in line and (_RE_HEADER.match(line) or 'Sr.     AIR     NEET' in line):
             in_table = True
             skip_next_line = True
             logger.info(f"Line {i+1}: Table start detected")
@@ -52,7 +110,8 @@ def parse_text_file(text):
 
         # Skip the second header line
         if skip_next_line:
-            logger.debug(f"Line {i+1}: Skipped - second header line")
+            if debug_enabled:
+                logger.debug("Line %d: Skipped - second header line", i + 1)
             skipped_lines += 1
             skip_next_line = False
             continue
@@ -64,129 +123,127 @@ def parse_text_file(text):
             continue
 
         # Skip header/footer lines when not in table
-        if not in_table and any(line.startswith(x) for x in ['GOVERNMENT', 'Note:', 'Admissions', 'SELECTION', 'Printed', 'I.Q.:']):
-            logger.debug(f"Line {i+1}: Skipped - header/footer")
+        if not in_table and line.startswith(_SKIP_PREFIXES):
+            if debug_enabled:
+                logger.debug("Line %d: Skipped - header/footer", i + 1)
             skipped_lines += 1
             continue
 
         # Skip Current Selection Details
         if 'Current Selection Details' in line:
-            logger.debug(f"Line {i+1}: Skipped - Current Selection Details")
+            if debug_enabled:
+                logger.debug("Line %d: Skipped - Current Selection Details", i + 1)
             skipped_lines += 1
             continue
 
         # Skip dividers
-        if line.startswith('----') or line.startswith('===='):
-            logger.debug(f"Line {i+1}: Skipped - divider line")
+        if line.startswith(('----', '====')):
+            if debug_enabled:
+                logger.debug("Line %d: Skipped - divider line", i + 1)
             skipped_lines += 1
             continue
 
         # Process data rows when in table
         if in_table:
-            parts = line.split()
-            if not parts or not parts[0].isdigit():
-                logger.debug(f"Line {i+1}: Skipped - not a data row (no Sr No)")
+            # Sr No, AIR, NEET Roll No. and CET Form No. are the first four tokens
+            parts = line.split(None, 4)
+            n = len(parts)
+            if not parts[0].isdigit():
+                if debug_enabled:
+                    logger.debug("Line %d: Skipped - not a data row (no Sr No)", i + 1)
                 skipped_lines += 1
                 continue
 
-            logger.info(f"Line {i+1}: Processing data row: {line}")
-            row = {}
-            idx = 0
-
-            # Sr No
-            if idx < len(parts) and parts[idx].isdigit():
-                row['Sr No'] = parts[idx]
-                idx += 1
-                logger.debug(f"Line {i+1}: Sr No = {row['Sr No']}")
-            else:
-                logger.warning(f"Line {i+1}: Invalid Sr No, skipping row")
-                continue
+            line_no = i + 1
+            logger.info(f"Line {line_no}: Processing data row: {line}")
+            sr_no = parts[0]
 
             # AIR
-            if idx < len(parts) and parts[idx].isdigit():
-                row['AIR'] = parts[idx]
-                idx += 1
-                logger.debug(f"Line {i+1}: AIR = {row['AIR']}")
+            if n > 1 and parts[1].isdigit():
+                air = parts[1]
             else:
-                logger.warning(f"Line {i+1}: Invalid AIR, skipping row")
+                logger.warning(f"Line {line_no}: Invalid AIR, skipping row")
                 continue
 
             # NEET Roll No.
-            if idx < len(parts) and parts[idx].isdigit():
-                row['NEET Roll No.'] = parts[idx]
-                idx += 1
-                logger.debug(f"Line {i+1}: NEET Roll No. = {row['NEET Roll No.']}")
+            if n > 2 and parts[2].isdigit():
+                neet_roll_no = parts[2]
             else:
-                logger.warning(f"Line {i+1}: Invalid NEET Roll No., skipping row")
+                logger.warning(f"Line {line_no}: Invalid NEET Roll No., skipping row")
                 continue
 
             # CET Form No.
-            if idx < len(parts) and parts[idx].isdigit():
-                row['CET Form No.'] = parts[idx]
-                idx += 1
-                logger.debug(f"Line {i+1}: CET Form No. = {row['CET Form No.']}")
+            if n > 3 and parts[3].isdigit():
+                cet_form_no = parts[3]
             else:
-                logger.warning(f"Line {i+1}: Invalid CET Form No., skipping row")
+                logger.warning(f"Line {line_no}: Invalid CET Form No., skipping row")
                 continue
 
-            # Name (collect until Gender)
-            name_parts = []
-            while idx < len(parts) and parts[idx] not in ['M', 'F']:
-                name_parts.append(parts[idx])
-                idx += 1
-            row['Name'] = ' '.join(name_parts) if name_parts else ''
-            logger.debug(f"Line {i+1}: Name = {row['Name']}")
-
-            # Gender
-            if idx < len(parts) and parts[idx] in ['M', 'F']:
-                row['Gender'] = parts[idx]
-                idx += 1
+            if debug_enabled:
+                logger.debug("Line %d: Sr No = %s", line_no, sr_no)
+                logger.debug("Line %d: AIR = %s", line_no, air)
+                logger.debug("Line %d: NEET Roll No. = %s", line_no, neet_roll_no)
+                logger.debug("Line %d: CET Form No. = %s", line_no, cet_form_no)
+
+            # Remaining columns
+            rest = parts[4] if n > 4 else ''
+
+            # Name runs up to the first standalone M/F token
+            match = gender_search(rest)
+            if match:
+                name = ' '.join(rest[:match.start()].split())
+                gender = match.group()
+                rest = rest[match.end():]
             else:
-                row['Gender'] = ''
-            logger.debug(f"Line {i+1}: Gender = {row['Gender']}")
+                name = ' '.join(rest.split())
+                gender = ''
+                rest = ''
+            if debug_enabled:
+                logger.debug("Line %d: Name = %s", line_no, name)
+                logger.debug("Line %d: Gender = %s", line_no, gender)
 
             # Category (optional, may include D1/D2/D3/PWD/ORP-C, but not if followed by (W))
-            cat = ''
-            if idx < len(parts) and parts[idx] in VALID_CATEGORIES:
+            parts = rest.split(None, 2)
+            category = ''
+            consumed = 0
+            if parts and parts[0] in valid_categories:
                 # Check if the next part is (W) or similar
-                if idx + 1 < len(parts) and re.match(r'^\(W\)$', parts[idx + 1]):
+                if len(parts) > 1 and parts[1] == '(W)':
                     # Skip category, move to quota
                     pass
                 else:
-                    cat = parts[idx]
-                    idx += 1
-                    if idx < len(parts) and parts[idx] in {'D1', 'D2', 'D3', 'PWD', 'ORP-C', 'HA', 'D1HA'} and cat not in {'D1', 'D2', 'D3', 'PWD', 'ORP-C', 'HA', 'D1HA'}:
-                        cat += ' ' + parts[idx]
-                        idx += 1
-            row['Category'] = cat.strip()
-            logger.debug(f"Line {i+1}: Category = {row['Category']}")
-
-            # Quota (collect until College Code or end)
-            quota_parts = []
-            while idx < len(parts) and not re.match(r'^\d+:', parts[idx]):
-                quota_parts.append(parts[idx])
-                idx += 1
-            quota = ' '.join(quota_parts) if quota_parts else ''
+                    category = parts[0]
+                    consumed = 1
+                    if len(parts) > 1 and parts[1] in dis_cats and category not in dis_cats:
+                        category += ' ' + parts[1]
+                        consumed = 2
+            rest = ' '.join(parts[consumed:])
+            if debug_enabled:
+                logger.debug("Line %d: Category = %s", line_no, category)
+
+            # Quota (up to College Code or end), College Code and College Name
+            match = college_search(rest)
+            if match:
+                quota = ' '.join(rest[:match.start()].split())
+                college_code = match.group(1)
+                college_name = ' '.join(rest[match.end():].split())
+            else:
+                quota = ' '.join(rest.split())
+                college_code = ''
+                college_name = ''
             if quota.startswith('Choice'):
                 quota = 'Choice Not Available'
-            row['Quota'] = quota
-            logger.debug(f"Line {i+1}: Quota = {row['Quota']}")
-
-            # College Code and College Name
-            college_code = ''
-            college_name = ''
-            if idx < len(parts):
-                college_parts = ' '.join(parts[idx:]).split(':', 1)
-                if len(college_parts) == 2:
-                    college_code = college_parts[0].strip()
-                    college_name = college_parts[1].strip()
-            row['College Code'] = college_code
-            row['College Name'] = college_name
-            logger.debug(f"Line {i+1}: College Code = {row['College Code']}")
-            logger.debug(f"Line {i+1}: College Name = {row['College Name']}")
-
-            # Log the complete row
-            logger.info(f"Line {i+1}: Parsed row: {row}")
+            if debug_enabled:
+                logger.debug("Line %d: Quota = %s", line_no, quota)
+                logger.debug("Line %d: College Code = %s", line_no, college_code)
+                logger.debug("Line %d: College Name = %s", line_no, college_name)
+
+            # Assemble the row in column order
+            row = (sr_no, air, neet_roll_no, cet_form_no, name, gender, category, quota, college_code, college_name)
+
+            # Log the complete row (debug only; formatting the whole row is costly per line)
+            if debug_enabled:
+                logger.debug("Line %d: Parsed row: %s", line_no, row)
 
             # Add row to data
             data.append(row)
@@ -196,21 +253,47 @@ def parse_text_file(text):
     return pd.DataFrame(data, columns=columns)
 
 # Function to save DataFrame to Excel
-def save_to_excel(df, output_file):
-    logger.info(f"Saving DataFrame with {len(df)} rows to {output_file}")
-    df.to_excel(output_file, index=False, engine='openpyxl')
-    logger.info(f"Data saved to {output_file}")
-    return output_file
+def save_to_excel(df):
+    logger.info(f"Saving DataFrame with {len(df)} rows to Excel")
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False, engine='xlsxwriter')
+    logger.info(f"Data saved to Excel ({buffer.tell()} bytes)")
+    return buffer.getvalue()
 
 # Function to read logs from memory (limit to last N lines)
-def read_logs(log_stream, max_lines=1000):
+def read_logs(log_buffer, max_lines=1000):
     try:
-        log_stream.seek(0)
-        lines = log_stream.readlines()
-        return ''.join(lines[-max_lines:])
+        lines = list(log_buffer)
+        return '\n'.join(lines[-max_lines:])
     except Exception as e:
         return f"Error reading logs: {e}"
 
+# Parse the text and build the Excel file; cached (bounded, shared across sessions) so
+# reruns with the same upload are free
+@st.cache_data(show_spinner=False, max_entries=16, ttl=3600)
+def process_file(text, verbose=False):
+    # Collect this call's logs in its own buffer; other sessions log through the same
+    # logger concurrently, so only records from the calling thread are kept
+    log_buffer = deque(maxlen=1000)
+    log_handler = RingBufferHandler(log_buffer)
+    log_handler.setLevel(logging.DEBUG if verbose else logging.INFO)
+    log_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    thread_id = threading.get_ident()
+    log_handler.addFilter(lambda record: record.thread == thread_id)
+    logger.addHandler(log_handler)
+
+    try:
+        logger.info("Text file uploaded successfully")
+        df = parse_text_file(text, verbose)
+        logger.info(f"Parsed DataFrame with {len(df)} rows")
+
+        # Build the Excel file in memory
+        excel_bytes = save_to_excel(df)
+    finally:
+        logger.removeHandler(log_handler)
+
+    return excel_bytes, read_logs(log_buffer, max_lines=1000)
+
 # Streamlit interface
 def main():
     st.title("Career Mantrana: Extract NEET-UG PDF")
@@ -297,18 +380,16 @@ def main():
         </style>
     """, unsafe_allow_html=True)
 
+    # Debug logging and the log panel are opt-in since they are emitted for every line parsed
+    verbose = st.checkbox("Verbose logs", value=False)
+
     # File uploader
     uploaded_file = st.file_uploader("Upload a .txt file converted from https://convertio.co/", type=["txt"])
 
     if uploaded_file is not None:
-        # Clear previous logs
-        log_stream.truncate(0)
-        log_stream.seek(0)
-
         # Read the uploaded file
         try:
-            text = uploaded_file.read().decode('utf-8')
-            logger.info("Text file uploaded successfully")
+            text = uploaded_file.getvalue().decode('utf-8')
         except Exception as e:
             st.error(f"Failed to read uploaded file: {e}")
             logger.error(f"Failed to read uploaded file: {e}")
@@ -317,29 +398,20 @@ def main():
         # Process the file
         with st.spinner("Processing file..."):
             try:
-                df = parse_text_file(text)
-                logger.info(f"Parsed DataFrame with {len(df)} rows")
-
-                # Save to a temporary Excel file
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-                    excel_file = save_to_excel(df, tmp.name)
+                excel_bytes, logs = process_file(text, verbose)
 
-                # Read and display logs (limited to last 1000 lines)
-                # st.subheader("Processing Logs")
-                # logs = read_logs(log_stream, max_lines=1000)
-                # st.markdown(f'<div class="log-container">{logs}</div>', unsafe_allow_html=True)
+                # Display logs (limited to last 1000 lines)
+                if verbose:
+                    st.subheader("Processing Logs")
+                    st.markdown(f'<div class="log-container">{html.escape(logs)}</div>', unsafe_allow_html=True)
 
                 # Download button for Excel
-                with open(excel_file, 'rb') as f:
-                    st.download_button(
-                        label="Download NEET Excel",
-                        data=f,
-                        file_name=f"selection_list_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-
-                # Clean up temporary file
-                os.unlink(excel_file)
+                st.download_button(
+                    label="Download NEET Excel",
+                    data=excel_bytes,
+                    file_name=f"selection_list_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
 
             except Exception as e:
                 st.error(f"Processing failed: {e}")